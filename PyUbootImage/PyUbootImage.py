@@ -4,15 +4,24 @@ PyUbootImage library for reading u-boot image files
 as defined in the official u-boot sources.
 """
 
+import mmap
+import os
+import socket
 import struct
 import sys
-from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
 
+try:
+    import numpy as _np
+except ImportError:  # numpy is optional and only speeds up multi-image scans
+    _np = None
 
-class _Codes(Enum):
+
+class _Codes(IntEnum):
 
     def __str__(self):
-        return self.LOOKUP_TABLE[self.value]
+        return self._name_str
 
 
 # Operating System Codes
@@ -255,10 +264,39 @@ Compression.LOOKUP_TABLE = ['None', 'gzip', 'bzip2', 'lzma', "lzo", "lz4", "zstd
 
 IH_COMP_EXT_LOOKUP = ['dat', 'gz', 'bz2', 'lzma', "lzo", "lz4", "zst"]
 
+# Cache each member's display name on the member itself so __str__ is a
+# single attribute read instead of a class-attribute table lookup.
+for _cls in (OperatingSystem, Architecture, Image, Compression):
+    for _member in _cls:
+        _member._name_str = _cls.LOOKUP_TABLE[_member]
+# The output file extension lives on the member too, so writers need a
+# single attribute read instead of a .value-indexed list lookup.
+for _member in Compression:
+    _member._ext = IH_COMP_EXT_LOOKUP[_member]
+del _cls, _member
+
 
 IH_MAGIC = 0x27051956  # Image Magic Number
 IH_NMLEN = 32  # Image Name Length
 
+# Direct value->member maps: a dict get instead of the Enum.__call__
+# machinery on every header parse.
+_OS_MAP = OperatingSystem._value2member_map_
+_ARCH_MAP = Architecture._value2member_map_
+_TYPE_MAP = Image._value2member_map_
+_COMP_MAP = Compression._value2member_map_
+
+
+def _lookupName(table, value):
+    """Resolve a numeric header code to its display name."""
+    if 0 <= value < len(table):
+        return table[value]
+    return '<not supported %02X>' % value
+
+# Pre-compiled Struct object so the format string is parsed only once
+# at import time instead of on every call.
+_HEADER_STRUCT = struct.Struct("!7I4B32s")
+
 
 class UBootImage:
     """Main class of this library containing
@@ -301,12 +339,14 @@ class UBootImage:
         as command interpreter (=> Shell Scripts).
     """
 
-    FORMAT = "!7I4B32s"
-    SIZE = struct.calcsize(FORMAT)
-    FIELDS = [
-        "ih_magic", "ih_hcrc", "ih_time", "ih_size", "ih_load", "ih_ep",
-        "ih_dcrc", "ih_os", "ih_arch", "ih_type", "ih_comp", "ih_name"
-    ]
+    FORMAT = _HEADER_STRUCT.format
+    SIZE = _HEADER_STRUCT.size
+
+    __slots__ = (
+        'ih_magic', 'ih_hcrc', 'ih_time', 'ih_size', 'ih_load', 'ih_ep',
+        'ih_dcrc', 'ih_os', 'ih_arch', 'ih_type', 'ih_comp', 'ih_name',
+        'part_offsets', '_buf', '_parts_cache', '_info_cache'
+    )
 
     def __init__(self):
         """Main constructor that builds a non-initialized object."""
@@ -322,52 +362,115 @@ class UBootImage:
         self.ih_type = 0  # Image Type
         self.ih_comp = 0  # Compression Type
         self.ih_name = ''  # Image Name
-        self.parts = []
+        self.part_offsets = []
+        self._buf = None
+        self._parts_cache = []
+        self._info_cache = None
+
+    @staticmethod
+    def peekMagic(buf):
+        """Cheap check whether buf starts with the u-boot image magic,
+        without decoding the rest of the header."""
+        return int.from_bytes(buf[:4], 'big') == IH_MAGIC
 
     def fill(self, buf):
-        """Fill the header only with the values read from buf array."""
-        values = struct.unpack_from(self.FORMAT, buf)
-        for field, value in zip(self.FIELDS, values):
-            setattr(self, field, value)
-        self.ih_os = OperatingSystem(self.ih_os)
-        self.ih_arch = Architecture(self.ih_arch)
-        self.ih_type = Image(self.ih_type)
-        self.ih_comp = Compression(self.ih_comp)
-        self.ih_name = self.ih_name.rstrip(b'\x00').decode()
+        """Fill the header only with the values read from buf array.
+
+        Buffers that do not start with the image magic are rejected with
+        a single integer compare: only ih_magic is set, so checkMagic()
+        reports the mismatch without paying for the full decode."""
+        if not UBootImage.peekMagic(buf):
+            self.ih_magic = int.from_bytes(buf[:4], 'big')
+            return
+        (self.ih_magic, self.ih_hcrc, self.ih_time, self.ih_size,
+         self.ih_load, self.ih_ep, self.ih_dcrc,
+         ih_os, ih_arch, ih_type, ih_comp,
+         ih_name) = _HEADER_STRUCT.unpack_from(buf)
+        # Unknown codes are kept as plain ints; the *_name properties
+        # render them as '<not supported XX>'.
+        self.ih_os = _OS_MAP.get(ih_os, ih_os)
+        self.ih_arch = _ARCH_MAP.get(ih_arch, ih_arch)
+        self.ih_type = _TYPE_MAP.get(ih_type, ih_type)
+        self.ih_comp = _COMP_MAP.get(ih_comp, ih_comp)
+        # The name is a NUL-terminated C string; cut at the first NUL
+        # instead of stripping padding from the right end.
+        end = ih_name.find(b'\x00')
+        self.ih_name = (ih_name if end < 0 else ih_name[:end]).decode('ascii', 'replace')
+        self._info_cache = None
 
     def checkMagic(self):
         """Check if the magic number contained in ih_magic field is correct or not."""
         return self.ih_magic == IH_MAGIC
 
-    def parse(self, buf):
-        """Read image header and extract the binary images."""
+    def parseHeader(self, buf):
+        """Read the image header only, leaving the payload untouched.
+
+        Scanners that just want metadata (OS/arch/type/name/size) can
+        call this with as little as SIZE bytes per candidate."""
         self.fill(buf)
-        if self.ih_type == Image.MULTI:
-            self.parts = self.getMultiParts(buf, self.SIZE)
+        return self
+
+    def parseParts(self, buf):
+        """Locate the binary images described by an already parsed header."""
+        buf = memoryview(buf)
+        if not self.checkMagic():
+            self.part_offsets = []
+        elif self.ih_type == Image.MULTI:
+            self.part_offsets = self.getMultiPartOffsets(buf, self.SIZE)
         else:
-            self.parts = [buf[self.SIZE : self.SIZE + self.ih_size]]
+            self.part_offsets = [(self.SIZE, self.ih_size)]
+        self._buf = buf
+        self._parts_cache = None
+        self._info_cache = None
         return self
 
+    def parse(self, buf):
+        """Read image header and extract the binary images.
+
+        Accepts any object supporting the buffer protocol; the extracted
+        parts are zero-copy memoryviews into buf (use bytes(part) when a
+        real copy is needed).
+        """
+        self.parseHeader(buf)
+        return self.parseParts(buf)
+
+    @property
+    def parts(self):
+        """Zero-copy views of the sub-images, materialized on first access
+        so metadata-only callers never pay for the slicing."""
+        if self._parts_cache is None:
+            buf = self._buf
+            self._parts_cache = [buf[ofs : ofs + size] for ofs, size in self.part_offsets]
+        return self._parts_cache
+
+    @parts.setter
+    def parts(self, value):
+        self._parts_cache = value
+
     @property
     def os_name(self):
-        return str(self.ih_os)
+        return _lookupName(OperatingSystem.LOOKUP_TABLE, self.ih_os)
 
     @property
     def arch_name(self):
-        return str(self.ih_arch)
+        return _lookupName(Architecture.LOOKUP_TABLE, self.ih_arch)
 
     @property
     def type_name(self):
-        return str(self.ih_type)
+        return _lookupName(Image.LOOKUP_TABLE, self.ih_type)
 
     @property
     def comp_name(self):
-        return str(self.ih_comp)
+        return _lookupName(Compression.LOOKUP_TABLE, self.ih_comp)
 
     def getInfo(self):
         """Return a dictionary with a human-readable version
-        of the content of the header."""
-        return {
+        of the content of the header.
+
+        The dictionary is built once per parse and cached."""
+        if self._info_cache is not None:
+            return self._info_cache
+        self._info_cache = {
             "MAGIC": self.ih_magic,
             "HCRC": self.ih_hcrc,
             "TIME": self.ih_time,
@@ -380,29 +483,62 @@ class UBootImage:
             "TYPE": self.type_name,
             "COMP": self.comp_name,
             "NAME": self.ih_name,
-            "PARTS": len(self.parts)
+            "PARTS": len(self.part_offsets)
         }
+        return self._info_cache
 
     def getMultiParts(self, buf, start):
         """Internal method used by parse() to separate binary images."""
-        ofs = []
-        p = []
-        fmt = "!I"
-        fmt_size = struct.calcsize(fmt)
-        while True:
-            val = struct.unpack_from(fmt, buf, start)[0]
-            if val == 0:
-                break
-            start += fmt_size
-            ofs.append(val)
-        for size in ofs:
-            part = buf[start : start + size]
-            pad = size % 4
-            if pad != 0:
-                size += 4 - pad
-            start += size
-            p.append(part)
-        return p
+        buf = memoryview(buf)
+        return [buf[ofs : ofs + size] for ofs, size in self.getMultiPartOffsets(buf, start)]
+
+    def getMultiPartOffsets(self, buf, start):
+        """Internal method used by parse() to locate the binary images:
+        returns a list of (offset, size) pairs, one per sub-image."""
+        table = memoryview(buf)[start:]
+        table = table[:len(table) & ~3]
+        if _np is not None:
+            # Vectorized scan over geometrically growing windows: the
+            # terminating zero sits right after the size table, so the
+            # comparison stays proportional to the table instead of
+            # touching (and faulting in) the whole payload.
+            count = len(table) // 4
+            window = 64
+            sizes = None
+            while count:
+                n = min(window, count)
+                arr = _np.frombuffer(table[:n * 4], dtype='>u4')
+                end = int((arr == 0).argmax())
+                if arr[end] == 0:
+                    sizes = arr[:end].tolist()
+                    break
+                if n == count:
+                    break
+                window *= 8
+            if sizes is None:
+                raise ValueError("multi-part size table has no terminator")
+        else:
+            # Cast the size table to native uint32 in one go instead of
+            # unpacking one value per loop iteration; ntohl fixes the
+            # byte order of each entry.
+            sizes = []
+            for val in table.cast('I'):
+                val = socket.ntohl(val)
+                if val == 0:
+                    break
+                sizes.append(val)
+            else:
+                raise ValueError("multi-part size table has no terminator")
+        # Skip the size entries and the terminating zero.
+        start += (len(sizes) + 1) * 4
+        # The entry count is known here, so fill a pre-sized list
+        # instead of growing one append by append.
+        offsets = [None] * len(sizes)
+        for i, size in enumerate(sizes):
+            offsets[i] = (start, size)
+            # Parts are aligned on uint32 boundaries; round up branchless.
+            start += (size + 3) & ~3
+        return offsets
 
 
 if __name__ == '__main__':
@@ -410,13 +546,47 @@ if __name__ == '__main__':
         print('Usage: %s path_to_u-boot_image' % sys.argv[0])
         sys.exit(0)
     with open(sys.argv[1], 'rb') as f:
-        image_data = f.read()
-    image = UBootImage().parse(image_data)
-    if not image.checkMagic():
-        print("Bad magic number!")
-        sys.exit(1)
-    print("Found image!\n\t" + "\n\t".join([key.ljust(5) + ": " + str(val) for key, val in image.getInfo().items()]))
-    format_string = 'part_%02d.' + IH_COMP_EXT_LOOKUP[image.ih_comp.value]
-    for i, part in enumerate(image.parts):
-        with open(format_string % i, 'wb') as f:
-            f.write(part)
+        # Map the file instead of reading it: pages are faulted in on
+        # demand and shared with the page cache, so the image is never
+        # duplicated in a Python bytes object.
+        image_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        image = UBootImage().parse(image_data)
+        if not image.checkMagic():
+            print("Bad magic number!")
+            sys.exit(1)
+        print("Found image!\n\t" + "\n\t".join([key.ljust(5) + ": " + str(val) for key, val in image.getInfo().items()]))
+        # Unknown compression codes survive fill() as plain ints without
+        # an _ext; fall back to the generic extension for them.
+        ext = getattr(image.ih_comp, '_ext', 'dat')
+
+        def write_part(i, offset, size):
+            with open(f'part_{i:02d}.{ext}', 'wb') as out:
+                # Only Linux allows a regular file as the sendfile
+                # destination; elsewhere write the memoryview directly.
+                if sys.platform == 'linux':
+                    # Copy straight from the mapped input file to the
+                    # output inode without a userspace round-trip.
+                    sent = 0
+                    while sent < size:
+                        n = os.sendfile(out.fileno(), f.fileno(), offset + sent, size - sent)
+                        if n == 0:
+                            # EOF: the header claims more bytes than the
+                            # file contains (truncated image).
+                            break
+                        sent += n
+                else:
+                    out.write(image.parts[i])
+
+        if len(image.part_offsets) > 1:
+            # Writes release the GIL, so parts of a multi-image can hit
+            # the disk in parallel; a single part skips the pool.
+            with ThreadPoolExecutor(max_workers=min(8, len(image.part_offsets))) as pool:
+                futures = [pool.submit(write_part, i, offset, size)
+                           for i, (offset, size) in enumerate(image.part_offsets)]
+            # Surface worker errors (disk full, permissions, ...) instead
+            # of exiting 0 with parts missing.
+            for future in futures:
+                future.result()
+        else:
+            for i, (offset, size) in enumerate(image.part_offsets):
+                write_part(i, offset, size)